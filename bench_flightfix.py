@@ -0,0 +1,72 @@
+import argparse
+import time
+import numpy as np
+
+from flightfix import load_geofence, fix_flight_plan, simplify_flight_plan
+
+
+# Competition sized geofence (lat, lon)
+GEOFENCE_COORDS = [
+    (38.3150, -76.5530),
+    (38.3160, -76.5450),
+    (38.3100, -76.5420),
+    (38.3080, -76.5500),
+    (38.3120, -76.5560)
+]
+
+
+# Lawnmower survey pattern, densely sampled so most points are collinear
+def make_survey_plan(num_waypoints, inner_polygon):
+    min_lon, min_lat, max_lon, max_lat = inner_polygon.bounds
+    num_rows = 20
+    points_per_row = max(num_waypoints // num_rows, 2)
+
+    plan = []
+    for row, lat in enumerate(np.linspace(min_lat, max_lat, num_rows)):
+        lons = np.linspace(min_lon, max_lon, points_per_row)
+        if row % 2:
+            lons = lons[::-1]
+        plan.extend((lat, lon) for lon in lons)
+    return plan
+
+
+# Random waypoints around the geofence (lots of boundary detours)
+def make_random_plan(num_waypoints, inner_polygon, seed=0):
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = inner_polygon.bounds
+    lats = rng.uniform(min_lat, max_lat, num_waypoints)
+    lons = rng.uniform(min_lon, max_lon, num_waypoints)
+    return list(zip(lats, lons))
+
+
+def time_call(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start_time) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks flight plan fixing and simplification on large plans")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Number of input waypoints to benchmark.")
+    parser.add_argument("--tolerance", type=float, default=3, help="Simplification tolerance in feet.")
+    args = parser.parse_args()
+
+    geofence = load_geofence(GEOFENCE_COORDS, 25, 23, cache_dir=None)
+    inner_polygon = geofence["inner"]
+
+    print(f"{'plan':>8} {'input':>7} {'fixed':>7} {'simple':>7} {'fewer':>6} {'fix ms':>9} {'simplify ms':>12}")
+    for name, make_plan in (("survey", make_survey_plan), ("random", make_random_plan)):
+        for size in args.sizes:
+            plan = make_plan(size, inner_polygon)
+            fixed, fix_ms = time_call(fix_flight_plan, plan, inner_polygon, geofence["boundary"])
+            simplified, simplify_ms = time_call(simplify_flight_plan, fixed, inner_polygon, args.tolerance)
+
+            # Mission items are the waypoints plus the speed command
+            items_fixed = len(fixed) + 1
+            items_simple = len(simplified) + 1
+            fewer = 100 * (items_fixed - items_simple) / items_fixed
+            print(f"{name:>8} {len(plan):>7} {items_fixed:>7} {items_simple:>7} {fewer:>5.0f}% {fix_ms:>9.1f} {simplify_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import statistics
+import sys
+import tempfile
+import time
+
+import mavlink
+from simvehicle import SimulatedDrone
+from mavsdk.offboard import PositionNedYaw
+
+
+# mavlink.py settings that are in seconds (scaled down with the simulation's time_scale)
+TIMING_SETTINGS = ("HEALTH_TIMEOUT", "TELEMETRY_LOST_WAIT", "RTL_WAIT", "SETTLE_HOLD_TIME", "ARRIVAL_TIMEOUT", "PAYLOAD_RELEASE_TIME")
+_original_timing = {name: getattr(mavlink, name) for name in TIMING_SETTINGS}
+
+
+# Makes mavlink.py wait in simulated seconds instead of real ones
+def scale_mavlink_timing(time_scale):
+    for name, value in _original_timing.items():
+        setattr(mavlink, name, value / time_scale)
+
+
+# Measures how late the event loop wakes up a task that sleeps interval seconds
+async def loop_lag_probe(lags, interval=0.001):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+# Setpoint response: time from sending set_position_ned until the hub delivers the first update showing motion
+# (link latency + telemetry period + hub fan-out, in simulated seconds)
+async def bench_setpoint_response(time_scale, repeats):
+    drone = SimulatedDrone(time_scale=time_scale, mission_items=0)
+    loop = asyncio.get_running_loop()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await mavlink.connect_drone(drone)
+        hub = mavlink.TelemetryHub(drone)
+        hub.start()
+        await mavlink.switch_to_offboard(drone)
+
+    latencies = []
+    updates = hub.subscribe("position_velocity_ned")
+    for i in range(repeats):
+        # Starts every leg from a hover
+        if await mavlink.wait_for_settle(hub) is None:
+            print("  vehicle did not settle, stopping early")
+            break
+        while not updates.empty():
+            updates.get_nowait()
+
+        start = loop.time()
+        await drone.offboard.set_position_ned(PositionNedYaw(5.0 * (i % 2 == 0), 0.0, -5.0, 0.0))
+        while True:
+            velocity = (await mavlink.next_update(updates)).velocity
+            if math.sqrt(velocity.north_m_s ** 2 + velocity.east_m_s ** 2 + velocity.down_m_s ** 2) > mavlink.SETTLE_SPEED:
+                break
+        latencies.append((loop.time() - start) * time_scale)
+
+    hub.unsubscribe("position_velocity_ned", updates)
+    await hub.stop()
+
+    if latencies:
+        print(f"Setpoint to first motion update ({len(latencies)} legs, link latency {drone.command_latency * 1000:.0f} ms, "
+              f"telemetry at 10 Hz): mean {statistics.mean(latencies) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+
+
+# Runs main() against simulated drones, all in one event loop
+async def bench_main(time_scale, num_vehicles):
+    drones = [SimulatedDrone(time_scale=time_scale) for _ in range(num_vehicles)]
+    lags = []
+    probe = asyncio.create_task(loop_lag_probe(lags))
+
+    with tempfile.TemporaryDirectory() as log_root, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        await asyncio.gather(*(mavlink.main(drone, log_directory=f"{log_root}/{i}") for i, drone in enumerate(drones)))
+        elapsed = time.perf_counter() - start
+
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+
+    landed = sum(any(name == "land" for _, name in drone.command_log) for drone in drones)
+    sim_times = [drone.sim_time() for drone in drones]
+    print(f"  {num_vehicles:>4} vehicles: {elapsed:.2f} s real, {statistics.mean(sim_times):.1f} s sim each, "
+          f"{landed}/{num_vehicles} landed, loop lag p99 {percentile(lags, 0.99) * 1000:.2f} ms, max {max(lags) * 1000:.2f} ms")
+
+
+# Telemetry loss during the mission: checks when RTL and kill happen
+# Returns False if the failsafe didn't trigger or was off by more than tolerance (simulated seconds)
+async def bench_failsafe(time_scale, loss_at, mode, tolerance):
+    drone = SimulatedDrone(time_scale=time_scale, mission_items=1000)
+    drone.inject_telemetry_loss(loss_at, mode=mode)
+
+    # Silence is noticed after HEALTH_TIMEOUT, a bad health message within one message period (1 s)
+    detection_time = _original_timing["HEALTH_TIMEOUT"] if mode == "silent" else 1.0
+    expected_rtl = detection_time + _original_timing["TELEMETRY_LOST_WAIT"]
+    expected_kill = expected_rtl + _original_timing["RTL_WAIT"]
+
+    with tempfile.TemporaryDirectory() as log_root, contextlib.redirect_stdout(io.StringIO()):
+        main_task = asyncio.create_task(mavlink.main(drone, log_directory=log_root))
+        # Mission never finishes without telemetry, so main() is stopped once the motors are killed
+        while drone.mode != "killed" and not main_task.done() and drone.sim_time() < loss_at + 2 * expected_kill:
+            await asyncio.sleep(0.01)
+        main_task.cancel()
+        await asyncio.gather(main_task, return_exceptions=True)
+
+    command_times = {name: sim_time for sim_time, name in drone.command_log}
+    if "return_to_launch" not in command_times or "kill" not in command_times:
+        print(f"  {mode:>9} loss at {loss_at:.0f} s: FAIL, failsafe did not trigger!")
+        return False
+
+    rtl = command_times["return_to_launch"] - loss_at
+    kill = command_times["kill"] - loss_at
+    rtl_error = rtl - expected_rtl
+    kill_error = kill - expected_kill
+    ok = abs(rtl_error) <= tolerance and abs(kill_error) <= tolerance
+    print(f"  {mode:>9} loss at {loss_at:.0f} s: RTL after {rtl:.1f} s (expected ~{expected_rtl:.0f}, {rtl_error:+.1f}), "
+          f"kill after {kill:.1f} s (expected ~{expected_kill:.0f}, {kill_error:+.1f}) "
+          f"{'ok' if ok else f'FAIL, off by more than {tolerance:g} s'}")
+    return ok
+
+
+# Returns True if all failsafe checks passed
+async def run(args):
+    scale_mavlink_timing(args.time_scale)
+
+    await bench_setpoint_response(args.time_scale, args.repeats)
+
+    print(f"End-to-end main() at {args.time_scale:g}x")
+    for num_vehicles in args.vehicles:
+        await bench_main(args.time_scale, num_vehicles)
+
+    print(f"Failsafe timing (tolerance {args.tolerance:g} s)")
+    passed = True
+    for mode in ("silent", "unhealthy"):
+        passed = await bench_failsafe(args.time_scale, loss_at=3.0, mode=mode, tolerance=args.tolerance) and passed
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks mavlink.py against simulated vehicles")
+    parser.add_argument("--time-scale", type=float, default=50, help="How much faster than real time the simulation runs.")
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[1, 10, 50], help="Numbers of vehicles to run concurrently.")
+    parser.add_argument("--repeats", type=int, default=20, help="Setpoints sent in the setpoint response benchmark.")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="Allowed failsafe timing error in simulated seconds.")
+    args = parser.parse_args()
+
+    # Non-zero exit code so CI notices a failsafe that is late, early or missing
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
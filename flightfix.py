@@ -1,10 +1,20 @@
 import argparse
+import hashlib
+import os
+import time
 import numpy as np
 import json
 import matplotlib.pyplot as plt
-from shapely.geometry import Polygon, Point, LineString
+import shapely
+from shapely import STRtree, wkb
+from shapely.errors import ShapelyError
+from shapely.geometry import Polygon, Point, LineString, MultiPolygon
+from shapely.ops import unary_union
 
 
+# Altitude of every waypoint in generated .plan files
+PLAN_ALTITUDE_FT = 100
+
 
 # Sets up the 25 ft boundary from the edge of the geofence
 def create_inward_offset(geofence_coords, offset_distance, inner_offset_distance):
@@ -33,6 +43,204 @@ def create_inward_offset(geofence_coords, offset_distance, inner_offset_distance
         raise
 
 
+# In-memory geofence cache (same field fence gets reused for many replans)
+_geofence_cache = {}
+
+
+# Hash of any JSON data (used as the cache key)
+def _cache_key(key_data):
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Hash of the geofence coordinates and offsets (used as the cache key)
+def geofence_cache_key(geofence_coords, offset_distance, inner_offset_distance):
+    return _cache_key({
+        "geofence": [[float(lat), float(lon)] for lat, lon in geofence_coords],
+        "offset_distance": float(offset_distance),
+        "inner_offset_distance": float(inner_offset_distance)
+    })
+
+
+# Reads cached geometries from disk (None if they aren't cached yet or the cache file is broken)
+def _read_cached_geometries(cache_dir, key, names):
+    cache_file = os.path.join(cache_dir, f"{key}.json") if cache_dir else None
+    if not cache_file or not os.path.exists(cache_file):
+        return None
+
+    try:
+        with open(cache_file, "r") as f:
+            cached = json.load(f)
+        return [wkb.loads(cached[name], hex=True) for name in names]
+    except (OSError, ValueError, KeyError, TypeError, ShapelyError) as e:
+        # A bad cache file is just a miss (the geometry gets recomputed and the file rewritten)
+        print(f"Ignoring broken geofence cache file '{cache_file}': {e}")
+        return None
+
+
+# Writes geometries to the disk cache (a failed write is only logged, the cache is optional)
+def _write_cached_geometries(cache_dir, key, names, geometries):
+    if not cache_dir:
+        return
+
+    cache_file = os.path.join(cache_dir, f"{key}.json")
+    cached = {name: wkb.dumps(geometry, hex=True) for name, geometry in zip(names, geometries)}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Writes to a temp file first so a half-written cache is never read
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(cached, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Could not write geofence cache file '{cache_file}': {e}")
+
+
+# Builds the prepared geometries and boundary used for routing
+def _build_geofence_entry(original_polygon, inward_offset_polygon, inner_inward_offset_polygon):
+    for polygon in (original_polygon, inward_offset_polygon, inner_inward_offset_polygon):
+        shapely.prepare(polygon)
+
+    boundary_line = inner_inward_offset_polygon.exterior
+    shapely.prepare(boundary_line)
+
+    return {
+        "original": original_polygon,
+        "offset": inward_offset_polygon,
+        "inner": inner_inward_offset_polygon,
+        "boundary": boundary_line
+    }
+
+
+# Gets the offset polygons for a geofence (from memory, then disk, then computes them)
+def load_geofence(geofence_coords, offset_distance, inner_offset_distance, cache_dir=".geofence_cache"):
+    try:
+        key = geofence_cache_key(geofence_coords, offset_distance, inner_offset_distance)
+
+        if key in _geofence_cache:
+            return _geofence_cache[key]
+
+        names = ("original", "offset", "inner")
+        polygons = _read_cached_geometries(cache_dir, key, names)
+        if polygons is None:
+            polygons = create_inward_offset(geofence_coords, offset_distance, inner_offset_distance)
+            _write_cached_geometries(cache_dir, key, names, polygons)
+
+        entry = _build_geofence_entry(*polygons)
+        _geofence_cache[key] = entry
+        return entry
+    except Exception as e:
+        print(f"Error loading geofence: {e}")
+        raise
+
+
+# Sets up the flyable area for a geofence with several inclusion zones and exclusion zones (polygons and circles)
+def create_geofence_zones(geofence, offset_distance, inner_offset_distance):
+    try:
+        feet_to_degrees = 1 / 364000.0
+        meters_to_feet = 1 / 0.3048
+        offset_distance_deg = (offset_distance + inner_offset_distance) * feet_to_degrees
+
+        inclusion_zones = []
+        exclusion_zones = []
+
+        for zone in geofence["polygons"]:
+            polygon = Polygon([(lon, lat) for lat, lon in zone["polygon"]])
+            (inclusion_zones if zone["inclusion"] else exclusion_zones).append(polygon)
+
+        for zone in geofence["circles"]:
+            lat, lon = zone["center"]
+            circle = Point(lon, lat).buffer(zone["radius"] * meters_to_feet * feet_to_degrees)
+            (inclusion_zones if zone["inclusion"] else exclusion_zones).append(circle)
+
+        if not inclusion_zones:
+            raise ValueError("Error: Geofence has no inclusion zones.")
+
+        # Inclusion zones shrink and exclusion zones grow by the same offsets as the single polygon fence
+        inner_inclusion_zones = [zone.buffer(-offset_distance_deg) for zone in inclusion_zones]
+        outer_exclusion_zones = [zone.buffer(offset_distance_deg) for zone in exclusion_zones]
+        exclusion_tree = STRtree(outer_exclusion_zones)
+
+        allowed_parts = []
+        for zone in inner_inclusion_zones:
+            if zone.is_empty:
+                continue
+
+            # Only cuts out the exclusion zones that actually touch this inclusion zone
+            hits = exclusion_tree.query(zone, predicate="intersects")
+            if len(hits):
+                zone = zone.difference(unary_union(exclusion_tree.geometries.take(hits)))
+
+            if not zone.is_empty:
+                allowed_parts.append(zone)
+
+        allowed_area = unary_union(allowed_parts)
+        if allowed_area.is_empty:
+            raise ValueError("Error: Geofence zones leave no flyable area. Adjust the offset distance.")
+
+        return allowed_area
+    except Exception as e:
+        print(f"Error creating geofence zones: {e}")
+        raise
+
+
+# Builds the spatial indexes used for zone queries and routing
+def _build_zones_entry(allowed_area):
+    components = list(allowed_area.geoms) if isinstance(allowed_area, MultiPolygon) else [allowed_area]
+    rings = [ring for component in components for ring in (component.exterior, *component.interiors)]
+    # Boundary detours lie on the rings, so fixed plans are checked against a slightly grown area (floating point error)
+    allowed_check = allowed_area.buffer(1e-9)
+
+    for geometry in (allowed_area, allowed_check, *components, *rings):
+        shapely.prepare(geometry)
+
+    return {
+        "allowed": allowed_area,
+        "allowed_check": allowed_check,
+        "components": components,
+        "component_tree": STRtree(components),
+        "rings": rings,
+        "ring_tree": STRtree(rings)
+    }
+
+
+# Gets the flyable area for a multi-zone geofence (from memory, then disk, then computes it)
+def load_geofence_zones(geofence, offset_distance, inner_offset_distance, cache_dir=".geofence_cache"):
+    try:
+        key = _cache_key({
+            "zones": geofence_to_plan_section(geofence),
+            "offset_distance": float(offset_distance),
+            "inner_offset_distance": float(inner_offset_distance)
+        })
+
+        if key in _geofence_cache:
+            return _geofence_cache[key]
+
+        cached = _read_cached_geometries(cache_dir, key, ("allowed",))
+        if cached is None:
+            allowed_area = create_geofence_zones(geofence, offset_distance, inner_offset_distance)
+            _write_cached_geometries(cache_dir, key, ("allowed",), (allowed_area,))
+        else:
+            allowed_area = cached[0]
+
+        entry = _build_zones_entry(allowed_area)
+        _geofence_cache[key] = entry
+        return entry
+    except Exception as e:
+        print(f"Error loading geofence zones: {e}")
+        raise
+
+
+# Checks if a geometry is inside the flyable area of the zones
+def zones_cover(zones, geometry):
+    return len(zones["component_tree"].query(geometry, predicate="covered_by")) > 0
+
+
+# Fixes a batch of flight plans against one (cached) geofence
+def fix_flight_plans(flight_plans, geofence_coords, offset_distance=25, inner_offset_distance=23, cache_dir=".geofence_cache"):
+    geofence = load_geofence(geofence_coords, offset_distance, inner_offset_distance, cache_dir=cache_dir)
+    return [fix_flight_plan(flight_plan_coords, geofence["inner"], geofence["boundary"]) for flight_plan_coords in flight_plans]
+
+
 # For plotting the geofence and new points (optional)
 def plot_polygons(original_polygon, inward_offset_polygon, inner_inward_offset_polygon, flight_plan_coords, fixed_flight_plan):
     try:
@@ -65,6 +273,47 @@ def plot_polygons(original_polygon, inward_offset_polygon, inner_inward_offset_p
         raise
 
 
+# For plotting a multi-zone geofence and new points (optional)
+def plot_geofence_zones(geofence, flyable_area, flight_plan_coords, fixed_flight_plan):
+    try:
+        plt.figure(figsize=(10, 10))
+
+        for zone in geofence["polygons"]:
+            zone_coords = np.array([(lon, lat) for lat, lon in zone["polygon"] + [zone["polygon"][0]]])
+            color = 'blue' if zone["inclusion"] else 'red'
+            plt.plot(zone_coords[:, 0], zone_coords[:, 1], color=color)
+            plt.fill(zone_coords[:, 0], zone_coords[:, 1], color=color, alpha=0.1)
+
+        for zone in geofence["circles"]:
+            meters_to_degrees = 1 / 0.3048 / 364000.0
+            lat, lon = zone["center"]
+            color = 'blue' if zone["inclusion"] else 'red'
+            plt.gca().add_patch(plt.Circle((lon, lat), zone["radius"] * meters_to_degrees, color=color, alpha=0.1))
+
+        components = flyable_area.geoms if isinstance(flyable_area, MultiPolygon) else [flyable_area]
+        for component in components:
+            for ring in (component.exterior, *component.interiors):
+                ring_coords = np.array(ring.coords)
+                plt.plot(ring_coords[:, 0], ring_coords[:, 1], 'orange', linestyle='--')
+
+        flight_plan_coords_lonlat = np.array([(lon, lat) for lat, lon in flight_plan_coords])
+        fixed_coords = np.array([(lon, lat) for lat, lon in fixed_flight_plan])
+        plt.plot(flight_plan_coords_lonlat[:, 0], flight_plan_coords_lonlat[:, 1], 'g--', marker='o', label='Original Flight Plan', markersize=5)
+        plt.plot(fixed_coords[:, 0], fixed_coords[:, 1], 'm-', marker='x', label='Fixed Flight Plan', markersize=5)
+
+        plt.xlabel('Longitude')
+        plt.ylabel('Latitude')
+        plt.title('Inclusion (blue), Exclusion (red) and Flyable (orange) Zones with Flight Plans')
+        plt.legend()
+        plt.axis('equal')
+        plt.grid(True)
+        plt.show()
+
+    except Exception as e:
+        print(f"Error plotting geofence zones: {e}")
+        raise
+
+
 #  Helps with finding best path 
 def get_shortest_boundary_path(boundary_line, start_distance, end_distance, num_points=100): # Can choose number of points
     try:
@@ -97,63 +346,371 @@ def get_shortest_boundary_path(boundary_line, start_distance, end_distance, num_
         raise
 
 
+# Fixes a single segment of the flight plan (returns the start, the end and any boundary points between them)
+def fix_segment(start_coord, end_coord, inner_inward_offset_polygon, boundary_line):
+    start_point = Point(start_coord[1], start_coord[0])
+    end_point = Point(end_coord[1], end_coord[0])
+
+    if not inner_inward_offset_polygon.contains(start_point): # Checks if point is inside boundary
+        start_point = boundary_line.interpolate(boundary_line.project(start_point))
+
+    if not inner_inward_offset_polygon.contains(end_point):
+        end_point = boundary_line.interpolate(boundary_line.project(end_point))
+
+    line = LineString([start_point, end_point])
+    boundary_path = []
+
+    if not inner_inward_offset_polygon.contains(line):
+        start_distance = boundary_line.project(start_point)
+        end_distance = boundary_line.project(end_point)
+
+        # Checks best path (then keeps best points)
+
+        boundary_path_coords = get_shortest_boundary_path(boundary_line, start_distance, end_distance, num_points=4)
+
+        if boundary_path_coords and boundary_path_coords[0] == (start_point.x, start_point.y):
+            boundary_path_coords = boundary_path_coords[1:]
+
+        boundary_path = [(coord[1], coord[0]) for coord in boundary_path_coords]
+
+    return (start_point.y, start_point.x), (end_point.y, end_point.x), boundary_path
+
+
+# Joins fixed segments back into one flight plan
+def join_segments(segments):
+    fixed_flight_plan = []
+
+    for i, (start, end, boundary_path) in enumerate(segments):
+        is_last = i == len(segments) - 1
+
+        if not fixed_flight_plan or fixed_flight_plan[-1] != start:
+            fixed_flight_plan.append(start)
+
+        # The next segment adds the end point itself, so it's dropped here
+        if not is_last and boundary_path and boundary_path[-1] == end:
+            boundary_path = boundary_path[:-1]
+
+        fixed_flight_plan.extend(boundary_path)
+
+        if is_last:
+            fixed_flight_plan.append(end)
+
+    return fixed_flight_plan
+
+
 # The main flight plan fixing function
-def fix_flight_plan(flight_plan_coords, inner_inward_offset_polygon):
+def fix_flight_plan(flight_plan_coords, inner_inward_offset_polygon, boundary_line=None):
     try:
-        fixed_flight_plan = []
-        boundary_line = inner_inward_offset_polygon.exterior
-        flight_plan_coords_lonlat = [(lon, lat) for lat, lon in flight_plan_coords]
+        if boundary_line is None:
+            boundary_line = inner_inward_offset_polygon.exterior
 
-        for i in range(len(flight_plan_coords_lonlat) - 1): # Checks if point is inside boundary
-            start_point = Point(flight_plan_coords_lonlat[i])
-            end_point = Point(flight_plan_coords_lonlat[i + 1])
+        segments = [fix_segment(flight_plan_coords[i], flight_plan_coords[i + 1], inner_inward_offset_polygon, boundary_line)
+                    for i in range(len(flight_plan_coords) - 1)]
 
-            if not inner_inward_offset_polygon.contains(start_point):
-                start_point = boundary_line.interpolate(boundary_line.project(start_point))
+        return join_segments(segments)
+    except Exception as e:
+        print(f"Error fixing flight plan: {e}")
+        raise
 
-            if not inner_inward_offset_polygon.contains(end_point):
-                end_point = boundary_line.interpolate(boundary_line.project(end_point))
 
-            line = LineString([start_point, end_point])
+# Keeps a fixed flight plan up to date while waypoints are edited (only changed segments get fixed again)
+class IncrementalFlightPlanner:
+    def __init__(self, inner_inward_offset_polygon, flight_plan_coords=(), boundary_line=None):
+        self.inner_inward_offset_polygon = inner_inward_offset_polygon
+        self.boundary_line = boundary_line if boundary_line is not None else inner_inward_offset_polygon.exterior
+        self.waypoints = [tuple(coord) for coord in flight_plan_coords]
+        # segments[i] is the fixed segment from waypoint i to i + 1 (None until it's fixed)
+        self.segments = [None] * max(len(self.waypoints) - 1, 0)
 
-            if inner_inward_offset_polygon.contains(line):
-                if not fixed_flight_plan or fixed_flight_plan[-1] != (start_point.y, start_point.x):
-                    fixed_flight_plan.append((start_point.y, start_point.x))
-                if i == len(flight_plan_coords_lonlat) - 2:
-                    fixed_flight_plan.append((end_point.y, end_point.x))
+    def __len__(self):
+        return len(self.waypoints)
+
+    def _mark_dirty(self, index):
+        if 0 <= index < len(self.segments):
+            self.segments[index] = None
+
+    def append(self, coord):
+        self.insert(len(self.waypoints), coord)
+
+    def insert(self, index, coord):
+        if index < 0 or index > len(self.waypoints):
+            raise IndexError(f"Waypoint index {index} out of range.")
+
+        self.waypoints.insert(index, tuple(coord))
+        if len(self.waypoints) < 2:
+            return
+
+        # Segment index - 1 now ends at the new point, and a new segment starts at it
+        self.segments.insert(min(index, len(self.segments)), None)
+        self._mark_dirty(index - 1)
+        self._mark_dirty(index)
+
+    def delete(self, index):
+        if index < 0 or index >= len(self.waypoints):
+            raise IndexError(f"Waypoint index {index} out of range.")
+
+        del self.waypoints[index]
+        if not self.segments:
+            return
+
+        # The two segments touching the point become one
+        del self.segments[min(index, len(self.segments) - 1)]
+        self._mark_dirty(index - 1)
+
+    def update(self, index, coord):
+        if index < 0 or index >= len(self.waypoints):
+            raise IndexError(f"Waypoint index {index} out of range.")
+
+        self.waypoints[index] = tuple(coord)
+        self._mark_dirty(index - 1)
+        self._mark_dirty(index)
+
+    def fixed_flight_plan(self):
+        try:
+            for i, segment in enumerate(self.segments):
+                if segment is None:
+                    self.segments[i] = fix_segment(self.waypoints[i], self.waypoints[i + 1], self.inner_inward_offset_polygon, self.boundary_line)
+
+            return join_segments(self.segments)
+        except Exception as e:
+            print(f"Error fixing flight plan: {e}")
+            raise
+
+
+# Ring vertices between two distances along a ring (going the shorter way around)
+def get_ring_path(ring, start_distance, end_distance):
+    coords = np.array(ring.coords)[:-1]
+    segment_lengths = np.hypot(*np.diff(np.array(ring.coords), axis=0).T)
+    vertex_distances = np.concatenate([[0.0], np.cumsum(segment_lengths)[:-1]])
+    total_length = ring.length
+
+    forward_distance = (end_distance - start_distance) % total_length
+    reverse_distance = (start_distance - end_distance) % total_length
+
+    if forward_distance <= reverse_distance:
+        offsets = (vertex_distances - start_distance) % total_length
+        mask = (offsets > 0) & (offsets < forward_distance)
+    else:
+        offsets = (start_distance - vertex_distances) % total_length
+        mask = (offsets > 0) & (offsets < reverse_distance)
+
+    order = np.argsort(offsets[mask])
+    return [tuple(map(float, coord)) for coord in coords[mask][order]]
+
+
+# Moves a point outside the flyable area onto the nearest zone boundary
+def snap_to_zones(point, zones):
+    if zones_cover(zones, point):
+        return point
+
+    ring = zones["rings"][int(zones["ring_tree"].nearest(point))]
+    return ring.interpolate(ring.project(point))
+
+
+# Fixes a single segment against a multi-zone geofence (same return values as fix_segment)
+# Both waypoints have to be in the same part of the flyable area, the detours stay inside that part
+def fix_segment_zones(start_coord, end_coord, zones):
+    start_point = snap_to_zones(Point(start_coord[1], start_coord[0]), zones)
+    end_point = snap_to_zones(Point(end_coord[1], end_coord[0]), zones)
+
+    component_index = int(zones["component_tree"].nearest(start_point))
+    if int(zones["component_tree"].nearest(end_point)) != component_index:
+        raise ValueError(f"Error: waypoints {start_coord} and {end_coord} are in separate flyable areas, "
+                         f"there is no path between them inside the geofence.")
+    component = zones["components"][component_index]
+    rings = [component.exterior, *component.interiors]
+
+    line = LineString([start_point, end_point])
+    boundary_path = []
+
+    if not component.covers(line):
+        # Splits the segment wherever it crosses the boundary of its part of the flyable area
+        crossing_distances = {0.0, line.length}
+        for ring in rings:
+            if line.intersects(ring):
+                crossing = line.intersection(ring)
+                crossing_distances.update(line.project(Point(coord)) for coord in shapely.get_coordinates(crossing))
+        crossing_distances = sorted(crossing_distances)
+
+        # Finds the parts of the segment that are outside it
+        outside_parts = []
+        for entry_distance, exit_distance in zip(crossing_distances, crossing_distances[1:]):
+            if exit_distance - entry_distance < 1e-12:
+                continue
+            if component.covers(line.interpolate((entry_distance + exit_distance) / 2)):
+                continue
+
+            if outside_parts and outside_parts[-1][1] == entry_distance:
+                outside_parts[-1][1] = exit_distance
             else:
-                if not fixed_flight_plan or fixed_flight_plan[-1] != (start_point.y, start_point.x):
-                    fixed_flight_plan.append((start_point.y, start_point.x))
+                outside_parts.append([entry_distance, exit_distance])
+
+        # Goes around the zone boundary for each outside part
+        for entry_distance, exit_distance in outside_parts:
+            entry_point = line.interpolate(entry_distance)
+            exit_point = line.interpolate(exit_distance)
+            boundary_path.append((entry_point.y, entry_point.x))
 
-                start_distance = boundary_line.project(start_point)
-                end_distance = boundary_line.project(end_point)
+            # Leaving and coming back into one part of the flyable area always goes through the same ring
+            ring = min(rings, key=entry_point.distance)
+            ring_path = get_ring_path(ring, ring.project(entry_point), ring.project(exit_point))
+            boundary_path.extend((coord[1], coord[0]) for coord in ring_path)
 
-                # Checks best path (then appends best points)
+            # The end point gets added by join_segments, so it isn't repeated here
+            if exit_point.coords[0] != end_point.coords[0]:
+                boundary_path.append((exit_point.y, exit_point.x))
 
-                boundary_path_coords = get_shortest_boundary_path(boundary_line, start_distance, end_distance, num_points=4)
+        if boundary_path and boundary_path[0] == (start_point.y, start_point.x):
+            boundary_path = boundary_path[1:]
 
-                if boundary_path_coords and boundary_path_coords[0] == (start_point.x, start_point.y):
-                    boundary_path_coords = boundary_path_coords[1:]
+    return (start_point.y, start_point.x), (end_point.y, end_point.x), boundary_path
 
-                if i != len(flight_plan_coords_lonlat) - 2 and boundary_path_coords and boundary_path_coords[-1] == (end_point.x, end_point.y):
-                    boundary_path_coords = boundary_path_coords[:-1]
 
-                for coord in boundary_path_coords:
-                    fixed_flight_plan.append((coord[1], coord[0]))
+# Checks that every leg of a fixed flight plan stays inside the flyable area
+def check_flight_plan_zones(fixed_flight_plan, zones):
+    if len(fixed_flight_plan) < 2:
+        return
 
-                if i == len(flight_plan_coords_lonlat) - 2:
-                    fixed_flight_plan.append((end_point.y, end_point.x))
+    legs = shapely.linestrings([[(lon, lat) for lat, lon in fixed_flight_plan[i:i + 2]]
+                                for i in range(len(fixed_flight_plan) - 1)])
+    outside = np.flatnonzero(~shapely.covers(zones["allowed_check"], legs))
+    if len(outside):
+        i = outside[0]
+        raise ValueError(f"Error: fixed flight plan leaves the flyable area between "
+                         f"{fixed_flight_plan[i]} and {fixed_flight_plan[i + 1]}.")
 
+
+# Flight plan fixing for a multi-zone geofence
+def fix_flight_plan_zones(flight_plan_coords, zones):
+    try:
+        segments = [fix_segment_zones(flight_plan_coords[i], flight_plan_coords[i + 1], zones)
+                    for i in range(len(flight_plan_coords) - 1)]
+
+        fixed_flight_plan = join_segments(segments)
+        check_flight_plan_zones(fixed_flight_plan, zones)
         return fixed_flight_plan
     except Exception as e:
         print(f"Error fixing flight plan: {e}")
         raise
 
 
+# Distance from each point to the segment a-b (in degrees)
+def _point_segment_distances(points, a, b):
+    ab = b - a
+    length_sq = np.dot(ab, ab)
+    if length_sq == 0:
+        return np.linalg.norm(points - a, axis=1)
+
+    t = np.clip((points - a) @ ab / length_sq, 0.0, 1.0)
+    closest = a + t[:, None] * ab
+    return np.linalg.norm(points - closest, axis=1)
+
+
+# Removes (near) collinear waypoints, like Douglas-Peucker, but only when the shortcut stays inside the inner geofence
+def simplify_flight_plan(fixed_flight_plan, inner_inward_offset_polygon, tolerance_ft=3):
+    try:
+        if len(fixed_flight_plan) < 3:
+            return list(fixed_flight_plan)
+
+        feet_to_degrees = 1 / 364000.0
+        tolerance_deg = tolerance_ft * feet_to_degrees
+
+        points = np.array(fixed_flight_plan, dtype=float)
+        keep = np.zeros(len(points), dtype=bool)
+        keep[0] = keep[-1] = True
+
+        # Uses a stack instead of recursion so big plans don't hit the recursion limit
+        stack = [(0, len(points) - 1)]
+        while stack:
+            first, last = stack.pop()
+            if last - first < 2:
+                continue
+
+            distances = _point_segment_distances(points[first + 1:last], points[first], points[last])
+            farthest = first + 1 + int(np.argmax(distances))
+
+            if distances.max() <= tolerance_deg:
+                shortcut = LineString([(points[first][1], points[first][0]), (points[last][1], points[last][0])])
+                if inner_inward_offset_polygon.covers(shortcut):
+                    continue
+
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+        return [coord for coord, kept in zip(fixed_flight_plan, keep) if kept]
+    except Exception as e:
+        print(f"Error simplifying flight plan: {e}")
+        raise
+
+
+# Converts a multi-zone geofence to the geoFence section of a .plan file
+def geofence_to_plan_section(geofence):
+    return {
+        "version": 2,
+        "polygons": [
+            {
+                "version": 1,
+                "inclusion": zone["inclusion"],
+                "polygon": [[round(lat, 7), round(lon, 7)] for lat, lon in zone["polygon"]]
+            }
+            for zone in geofence["polygons"]
+        ],
+        "circles": [
+            {
+                "version": 1,
+                "inclusion": zone["inclusion"],
+                "circle": {
+                    "center": [round(zone["center"][0], 7), round(zone["center"][1], 7)],
+                    "radius": zone["radius"]
+                }
+            }
+            for zone in geofence["circles"]
+        ]
+    }
+
+
+# Reads the geoFence section and mission waypoints from a QGroundControl .plan file
+# Only the plain waypoints' positions are used, other mission items and waypoint altitudes aren't carried over (prints a warning)
+def read_plan_file(filename):
+    with open(filename, "r") as f:
+        plan = json.load(f)
+
+    geofence_section = plan.get("geoFence", {})
+    geofence = {
+        "polygons": [
+            {"inclusion": bool(zone.get("inclusion", True)), "polygon": [(float(lat), float(lon)) for lat, lon in zone["polygon"]]}
+            for zone in geofence_section.get("polygons", [])
+        ],
+        "circles": [
+            {"inclusion": bool(zone.get("inclusion", True)), "center": (float(zone["circle"]["center"][0]), float(zone["circle"]["center"][1])), "radius": float(zone["circle"]["radius"])}
+            for zone in geofence_section.get("circles", [])
+        ]
+    }
+
+    # Only plain waypoints (command 16) are part of the flight plan
+    items = plan.get("mission", {}).get("items", [])
+    waypoint_items = [item for item in items if item.get("type") == "SimpleItem" and item.get("command") == 16]
+    flight_plan_coords = [(float(item["params"][4]), float(item["params"][5])) for item in waypoint_items]
+
+    # The speed command (178) is written again by generate_plan_file
+    dropped_items = [item for item in items if item.get("command") not in (16, 178) or item.get("type") != "SimpleItem"]
+    if dropped_items:
+        commands = sorted({str(item.get("command", item.get("complexItemType", item.get("type")))) for item in dropped_items})
+        print(f"Warning: {filename} has {len(dropped_items)} mission items that aren't plain waypoints "
+              f"(commands {', '.join(commands)}), they are not copied to the fixed plan.")
+
+    altitude_m = PLAN_ALTITUDE_FT * 0.3048
+    if any(abs(float(item["params"][6]) - altitude_m) > 0.01 for item in waypoint_items):
+        print(f"Warning: the waypoint altitudes in {filename} are not kept, the fixed plan flies at {PLAN_ALTITUDE_FT} ft.")
+
+    return geofence, flight_plan_coords
+
+
 # Generates the navigate.plan file (for uploading in QGroundControl)
 def generate_plan_file(fixed_flight_plan, geofence_coords, filename="navigate.plan"):
     try:
-        altitude_ft = 100
+        altitude_ft = PLAN_ALTITUDE_FT
         altitude_m = altitude_ft * 0.3048
         speed_mph = 30
         speed_ms = speed_mph * 0.44704
@@ -191,7 +748,9 @@ def generate_plan_file(fixed_flight_plan, geofence_coords, filename="navigate.pl
 
         planned_home_position = [home_lat, home_lon, altitude_m]
 
-        geofence_polygon = [[round(lat, 7), round(lon, 7)] for lat, lon in geofence_coords]
+        # geofence_coords can be a single inclusion polygon or a multi-zone geofence
+        if not isinstance(geofence_coords, dict):
+            geofence_coords = {"polygons": [{"inclusion": True, "polygon": geofence_coords}], "circles": []}
 
         plan = {
             "fileType": "Plan",
@@ -206,17 +765,7 @@ def generate_plan_file(fixed_flight_plan, geofence_coords, filename="navigate.pl
                 "items": mission_items,
                 "plannedHomePosition": planned_home_position
             },
-            "geoFence": {
-                "version": 2,
-                "polygons": [
-                    {
-                        "version": 1,
-                        "inclusion": True,
-                        "polygon": geofence_polygon
-                    }
-                ],
-                "circles": []
-            },
+            "geoFence": geofence_to_plan_section(geofence_coords),
             "rallyPoints": {
                 "version": 2,
                 "points": []
@@ -231,36 +780,94 @@ def generate_plan_file(fixed_flight_plan, geofence_coords, filename="navigate.pl
         raise
 
 
+# Reads the geofence and flight plan from an input .txt file
+def read_input_file(input_file):
+    coordinates = []
+    flight_plan_coords = []
+
+    with open(input_file, "r") as f:
+        lines = f.readlines()
+        N, M = map(int, lines[0].split())
+        for line in lines[1:N+1]:
+            lat, lon = map(float, line.strip().split())
+            coordinates.append((lat, lon))
+        for line in lines[N+1:N+1+M]:
+            lat, lon = map(float, line.strip().split())
+            flight_plan_coords.append((lat, lon))
+
+    return coordinates, flight_plan_coords
+
+
+# Fixes the flight plan in a .txt or .plan input file (returns the geofence, both plans and the flyable area)
+def fix_input(input_file, offset_distance, inner_offset_distance, cache_dir):
+    if input_file.endswith(".plan"):
+        geofence_coords, flight_plan_coords = read_plan_file(input_file)
+        zones = load_geofence_zones(geofence_coords, offset_distance, inner_offset_distance, cache_dir=cache_dir)
+        fixed_flight_plan = fix_flight_plan_zones(flight_plan_coords, zones)
+        return geofence_coords, flight_plan_coords, fixed_flight_plan, zones["allowed"]
+
+    geofence_coords, flight_plan_coords = read_input_file(input_file)
+    geofence = load_geofence(geofence_coords, offset_distance, inner_offset_distance, cache_dir=cache_dir)
+    fixed_flight_plan = fix_flight_plan(flight_plan_coords, geofence["inner"], geofence["boundary"])
+    return geofence_coords, flight_plan_coords, fixed_flight_plan, geofence["inner"]
+
+
+# Batch mode: fixes one input file into <name>.plan (the geofence comes from the cache when it was seen before)
+def fix_input_file(input_file, offset_distance, inner_offset_distance, cache_dir, simplify_tolerance=None):
+    start_time = time.perf_counter()
+
+    geofence_coords, flight_plan_coords, fixed_flight_plan, flyable_area = fix_input(input_file, offset_distance, inner_offset_distance, cache_dir)
+
+    waypoint_count = f"{len(fixed_flight_plan)} waypoints"
+
+    if simplify_tolerance is not None:
+        fixed_flight_plan = simplify_flight_plan(fixed_flight_plan, flyable_area, simplify_tolerance)
+        waypoint_count = f"{waypoint_count} -> {len(fixed_flight_plan)} simplified"
+
+    # Doesn't overwrite .plan inputs
+    plan_filename = os.path.splitext(input_file)[0] + (".fixed.plan" if input_file.endswith(".plan") else ".plan")
+    generate_plan_file(fixed_flight_plan, geofence_coords, filename=plan_filename)
+
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    print(f"{input_file} -> {plan_filename} ({waypoint_count}, {elapsed_ms:.1f} ms)")
+
+
 # Main function to run everything (with error handling)
 def main():
     parser = argparse.ArgumentParser(description="Fixes the flight plan entered by user")
-    parser.add_argument("input_file", help="Path to the input text file containing geofence and flight plan coordinates.")
+    parser.add_argument("input_file", nargs="+", help="Path to the input text file containing geofence and flight plan coordinates, or a QGroundControl .plan file. Pass several files to fix them as a batch.")
+    parser.add_argument("--cache-dir", default=".geofence_cache", help="Directory for the on-disk geofence cache.")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the on-disk geofence cache.")
+    parser.add_argument("--simplify", type=float, metavar="FEET", help="Drop waypoints within FEET of a straight line that stays inside the inner geofence.")
     
     args = parser.parse_args()
 
+    offset_distance = 25
+    inner_offset_distance = 23
+    cache_dir = None if args.no_cache else args.cache_dir
+    current_file = args.input_file[0]
+
     try:
-        coordinates = []
-        flight_plan_coords = []
-
-        with open(args.input_file, "r") as f:
-            lines = f.readlines()
-            N, M = map(int, lines[0].split())
-            for line in lines[1:N+1]:
-                lat, lon = map(float, line.strip().split())
-                coordinates.append((lat, lon))
-            for line in lines[N+1:N+1+M]:
-                lat, lon = map(float, line.strip().split())
-                flight_plan_coords.append((lat, lon))
-
-        geofence_coords = coordinates
-        offset_distance = 25
-        inner_offset_distance = 23
-
-        original_polygon, offset_polygon, inner_offset_polygon = create_inward_offset(geofence_coords, offset_distance, inner_offset_distance)
-        fixed_flight_plan = fix_flight_plan(flight_plan_coords, inner_offset_polygon)
+        if len(args.input_file) > 1:
+            for current_file in args.input_file:
+                fix_input_file(current_file, offset_distance, inner_offset_distance, cache_dir, args.simplify)
+            return
+
+        geofence_coords, flight_plan_coords, fixed_flight_plan, flyable_area = fix_input(current_file, offset_distance, inner_offset_distance, cache_dir)
+
+        if args.simplify is not None:
+            # Mission items are the waypoints plus the speed command
+            items_before = len(fixed_flight_plan) + 1
+            fixed_flight_plan = simplify_flight_plan(fixed_flight_plan, flyable_area, args.simplify)
+            items_after = len(fixed_flight_plan) + 1
+            print(f"Simplified mission: {items_before} -> {items_after} items ({100 * (items_before - items_after) / items_before:.0f}% fewer)")
 
         generate_plan_file(fixed_flight_plan, geofence_coords, filename="navigate.plan")
-        plot_polygons(original_polygon, offset_polygon, inner_offset_polygon, flight_plan_coords, fixed_flight_plan)
+        if isinstance(geofence_coords, dict):
+            plot_geofence_zones(geofence_coords, flyable_area, flight_plan_coords, fixed_flight_plan)
+        else:
+            geofence = load_geofence(geofence_coords, offset_distance, inner_offset_distance, cache_dir=cache_dir)
+            plot_polygons(geofence["original"], geofence["offset"], geofence["inner"], flight_plan_coords, fixed_flight_plan)
 
         print("Original Flight Plan:")
         print(flight_plan_coords)
@@ -268,7 +875,7 @@ def main():
         print(fixed_flight_plan)
 
     except FileNotFoundError:
-        print(f"Error: The file '{args.input_file}' was not found.")
+        print(f"Error: The file '{current_file}' was not found.")
     except ValueError as ve:
         print(f"Error parsing input file: {ve}")
     except Exception as e:
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import glob
+import os
+import time
+import numpy as np
+
+
+# Telemetry fields recorded for each hub stream
+RECORDED_FIELDS = {
+    "position": ("latitude_deg", "longitude_deg", "absolute_altitude_m", "relative_altitude_m"),
+    "attitude": ("roll_deg", "pitch_deg", "yaw_deg"),
+    "velocity": ("north_m_s", "east_m_s", "down_m_s"),
+    "battery": ("voltage_v", "remaining_percent"),
+    "health": ("is_global_position_ok", "is_home_position_ok", "is_local_position_ok", "is_armable")
+}
+
+
+# Preallocated ring buffer of timestamped rows
+class RingBuffer:
+    def __init__(self, fields, capacity):
+        self.fields = fields
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, len(fields)))
+        self.count = 0  # rows ever written
+        self.flushed = 0  # rows ever taken by take_unflushed
+        self.dropped = 0  # rows overwritten before they were flushed
+
+    def append(self, timestamp, row):
+        index = self.count % self.capacity
+        self.times[index] = timestamp
+        self.values[index] = row
+        self.count += 1
+
+    # Copies out the rows written since the last call
+    def take_unflushed(self):
+        pending = self.count - self.flushed
+        if pending > self.capacity:
+            self.dropped += pending - self.capacity
+            pending = self.capacity
+
+        indexes = np.arange(self.count - pending, self.count) % self.capacity
+        self.flushed = self.count
+        return self.times[indexes], self.values[indexes]
+
+
+# Writes one chunk file (runs in a worker thread)
+def _write_chunk(path, arrays):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+# Records hub telemetry into ring buffers and flushes them to .npz chunks in the background
+class FlightRecorder:
+    def __init__(self, hub, directory="flight_logs", capacity=4096, flush_interval=1.0):
+        self.hub = hub
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buffers = {name: RingBuffer(fields, capacity) for name, fields in RECORDED_FIELDS.items()}
+        self._listeners = {}
+        self._flush_task = None
+        self._stopping = None
+        self._chunk_index = 0
+
+        # Overhead bookkeeping (time spent on the event loop)
+        self.samples = 0
+        self.record_time = 0.0
+        self.flush_time = 0.0
+        self.start_time = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.start_time = time.perf_counter()
+        for name in self.buffers:
+            self._listeners[name] = self._make_listener(name)
+            self.hub.add_listener(name, self._listeners[name])
+        self._stopping = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for name, listener in self._listeners.items():
+            self.hub.remove_listener(name, listener)
+        self._listeners = {}
+
+        # The flush loop isn't cancelled: a chunk it already took from the buffers would never get written
+        if self._flush_task:
+            self._stopping.set()
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+    def _make_listener(self, name):
+        buffer = self.buffers[name]
+        fields = buffer.fields
+
+        def listener(value):
+            start = time.perf_counter()
+            buffer.append(time.time(), [float(getattr(value, field)) for field in fields])
+            self.samples += 1
+            self.record_time += time.perf_counter() - start
+
+        return listener
+
+    async def _flush_loop(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    # Copies out new rows on the loop, then writes them in a worker thread
+    async def flush(self):
+        start = time.perf_counter()
+        arrays = {}
+        first_time, last_time = None, None
+        for name, buffer in self.buffers.items():
+            times, values = buffer.take_unflushed()
+            if not len(times):
+                continue
+            arrays[f"{name}_time"] = times
+            arrays[f"{name}_values"] = values
+            arrays[f"{name}_fields"] = np.array(buffer.fields)
+            first_time = times[0] if first_time is None else min(first_time, times[0])
+            last_time = times[-1] if last_time is None else max(last_time, times[-1])
+        self.flush_time += time.perf_counter() - start
+
+        if not arrays:
+            return
+
+        # The time range is in the file name so the reader can skip chunks without opening them
+        path = os.path.join(self.directory, f"chunk_{self._chunk_index:06d}_{first_time:.6f}_{last_time:.6f}.npz")
+        self._chunk_index += 1
+        await asyncio.to_thread(_write_chunk, path, arrays)
+
+    # How much time the recorder took on the event loop
+    def overhead(self):
+        elapsed = time.perf_counter() - self.start_time if self.start_time else 0.0
+        loop_time = self.record_time + self.flush_time
+        return {
+            "samples": self.samples,
+            "dropped": sum(buffer.dropped for buffer in self.buffers.values()),
+            "us_per_sample": 1e6 * self.record_time / self.samples if self.samples else 0.0,
+            "loop_time_s": loop_time,
+            "loop_fraction": loop_time / elapsed if elapsed else 0.0
+        }
+
+
+# Reads recorded chunks back (only opens the chunks that overlap the query)
+class FlightLogReader:
+    def __init__(self, directory="flight_logs"):
+        self.chunks = []
+        for path in glob.glob(os.path.join(directory, "chunk_*.npz")):
+            _, _, first_time, last_time = os.path.basename(path)[:-len(".npz")].split("_")
+            self.chunks.append((float(first_time), float(last_time), path))
+        # Sorted by time, not file name (every recording starts again at chunk_000000)
+        self.chunks.sort()
+
+    # Returns the timestamps and a dict of field arrays for one stream between start_time and end_time
+    def query(self, name, start_time=None, end_time=None):
+        start_time = -np.inf if start_time is None else start_time
+        end_time = np.inf if end_time is None else end_time
+
+        fields = RECORDED_FIELDS[name]
+        times_parts, values_parts = [], []
+        for first_time, last_time, path in self.chunks:
+            if last_time < start_time or first_time > end_time:
+                continue
+
+            with np.load(path) as chunk:
+                if f"{name}_time" not in chunk.files:
+                    continue
+                times = chunk[f"{name}_time"]
+                first = np.searchsorted(times, start_time, side="left")
+                last = np.searchsorted(times, end_time, side="right")
+                if first < last:
+                    fields = tuple(chunk[f"{name}_fields"])
+                    times_parts.append(times[first:last])
+                    values_parts.append(chunk[f"{name}_values"][first:last])
+
+        if not times_parts:
+            return np.zeros(0), {field: np.zeros(0) for field in fields}
+
+        times = np.concatenate(times_parts)
+        values = np.concatenate(values_parts)
+        # Chunks only overlap if two recordings ran at the same time into one directory
+        if np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind="stable")
+            times, values = times[order], values[order]
+        return times, {field: values[:, i] for i, field in enumerate(fields)}
+
+
+# Prints a summary of a recorded flight log
+def main():
+    parser = argparse.ArgumentParser(description="Reads a flight log recorded by mavlink.py")
+    parser.add_argument("directory", nargs="?", default="flight_logs", help="Directory with the recorded chunks.")
+    parser.add_argument("--stream", default="position", choices=RECORDED_FIELDS.keys(), help="Telemetry stream to read.")
+    parser.add_argument("--start", type=float, help="Start time (unix seconds).")
+    parser.add_argument("--end", type=float, help="End time (unix seconds).")
+    args = parser.parse_args()
+
+    reader = FlightLogReader(args.directory)
+    times, values = reader.query(args.stream, args.start, args.end)
+
+    print(f"{len(reader.chunks)} chunks, {len(times)} {args.stream} samples")
+    if len(times):
+        print(f"From {times[0]:.3f} to {times[-1]:.3f} ({len(times) / max(times[-1] - times[0], 1e-9):.1f} Hz)")
+        for field, column in values.items():
+            print(f"  {field}: min {column.min():.6g}, max {column.max():.6g}, last {column[-1]:.6g}")
+
+
+if __name__ == "__main__":
+    main()
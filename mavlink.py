@@ -1,10 +1,28 @@
 import asyncio
+import math
 from mavsdk import System
 from mavsdk.offboard import PositionNedYaw
+from flightrecorder import FlightRecorder
 
-# Connects to the drone
-async def connect_drone():
-    drone = System()
+
+# Seconds without a health message before telemetry counts as lost
+HEALTH_TIMEOUT = 3.0
+
+# Failsafe waits (seconds) before RTL and before killing the motors
+TELEMETRY_LOST_WAIT = 30
+RTL_WAIT = 180
+
+# Arrival/settle detection for offboard legs and the payload drop
+ARRIVAL_TOLERANCE = 1.0  # meters from the target
+SETTLE_SPEED = 0.3  # m/s, slower than this counts as stopped
+SETTLE_HOLD_TIME = 1.0  # seconds it has to stay settled
+ARRIVAL_TIMEOUT = 30.0  # seconds before giving up on a leg
+PAYLOAD_RELEASE_TIME = 2.0  # seconds the actuator stays open
+
+# Connects to the drone (a simulated one can be passed in, see simvehicle.py)
+async def connect_drone(drone=None):
+    if drone is None:
+        drone = System()
     await drone.connect(system_address="udp://:14540")
 
     print("Waiting for drone to connect...")
@@ -15,17 +33,123 @@ async def connect_drone():
 
     return drone
 
-async def monitor_mission(drone):
+# Passed to subscribers when their telemetry stream fails or ends
+class TelemetryStreamError(Exception):
+    pass
+
+
+# Gets the next value from a hub subscription (raises TelemetryStreamError if the stream is gone)
+async def next_update(queue, timeout=None):
+    value = await asyncio.wait_for(queue.get(), timeout)
+    if isinstance(value, TelemetryStreamError):
+        raise value
+    return value
+
+
+# Opens each telemetry stream once and shares it with any number of subscribers
+class TelemetryHub:
+    def __init__(self, drone):
+        self.drone = drone
+        self.latest = {}  # newest value of each stream
+        self.last_update = {}  # loop time of the newest value
+        self.errors = {}  # streams that failed or ended
+        self._subscribers = {}
+        self._listeners = {}
+        self._tasks = []
+
+    def _streams(self):
+        return {
+            "health": self.drone.telemetry.health,
+            "position": self.drone.telemetry.position,
+            "attitude": self.drone.telemetry.attitude_euler,
+            "position_velocity_ned": self.drone.telemetry.position_velocity_ned,
+            "velocity": self.drone.telemetry.velocity_ned,
+            "battery": self.drone.telemetry.battery,
+            "mission_progress": self.drone.mission.mission_progress
+        }
+
+    def start(self):
+        for name, stream in self._streams().items():
+            self._tasks.append(asyncio.create_task(self._run_stream(name, stream)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @staticmethod
+    def _put(queue, value):
+        if queue.full():  # slow subscribers only miss the oldest values
+            queue.get_nowait()
+        queue.put_nowait(value)
+
+    async def _run_stream(self, name, stream):
+        loop = asyncio.get_running_loop()
+        try:
+            async for value in stream():
+                self.latest[name] = value
+                self.last_update[name] = loop.time()
+                for listener in list(self._listeners.get(name, [])):
+                    # A broken listener is dropped, it must not take the stream (and the failsafe) down with it
+                    try:
+                        listener(value)
+                    except Exception as e:
+                        print(f"-- Telemetry listener error on {name}, removing it: {e!r}")
+                        self.remove_listener(name, listener)
+                for queue in self._subscribers.get(name, []):
+                    self._put(queue, value)
+            error = TelemetryStreamError(f"{name} stream ended")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = TelemetryStreamError(f"{name} stream failed: {e}")
+
+        # Subscribers get the error instead of waiting forever
+        print(f"-- Telemetry error: {error}")
+        self.errors[name] = error
+        for queue in self._subscribers.get(name, []):
+            self._put(queue, error)
+
+    # Returns a queue that gets every new value of the stream (read it with next_update)
+    def subscribe(self, name, maxsize=16):
+        queue = asyncio.Queue(maxsize)
+        self._subscribers.setdefault(name, []).append(queue)
+        if name in self.errors:
+            queue.put_nowait(self.errors[name])
+        return queue
+
+    def unsubscribe(self, name, queue):
+        self._subscribers[name].remove(queue)
+
+    # Calls listener(value) right away for every new value (for cheap, non-blocking work like recording)
+    def add_listener(self, name, listener):
+        self._listeners.setdefault(name, []).append(listener)
+
+    def remove_listener(self, name, listener):
+        listeners = self._listeners.get(name, [])
+        if listener in listeners:  # already gone if it raised
+            listeners.remove(listener)
+
+
+async def monitor_mission(hub):
     print("Waiting for mission to start...")
-    async for mission_progress in drone.mission.mission_progress():
-        print(f"Mission progress: "
-              f"{mission_progress.current}/"
-              f"{mission_progress.total}")
-        if mission_progress.current == mission_progress.total:
-            print("Mission completed!")
-            return True 
-        await asyncio.sleep(1)
-    return False
+    progress_updates = hub.subscribe("mission_progress")
+    try:
+        while True:
+            try:
+                mission_progress = await next_update(progress_updates)
+            except TelemetryStreamError as e:
+                print(f"Mission progress lost: {e}")
+                return False
+            print(f"Mission progress: "
+                  f"{mission_progress.current}/"
+                  f"{mission_progress.total}")
+            if mission_progress.current == mission_progress.total:
+                print("Mission completed!")
+                return True
+    finally:
+        hub.unsubscribe("mission_progress", progress_updates)
 
 async def switch_to_offboard(drone):
     print("-- Setting initial offboard setpoint")
@@ -41,71 +165,159 @@ async def switch_to_offboard(drone):
         await drone.action.disarm()
         return False
 
-async def fly_to_ned(drone, north, east, down, yaw):
+# Waits until the drone is settled (and within tolerance of target, if given) for hold_time seconds
+# Returns how long it took, or None if it timed out
+async def wait_for_settle(hub, target=None, tolerance=None, speed_tolerance=None, hold_time=None, timeout=None):
+    # Defaults are read here (not in the signature) so the module settings can be changed at runtime
+    tolerance = ARRIVAL_TOLERANCE if tolerance is None else tolerance
+    speed_tolerance = SETTLE_SPEED if speed_tolerance is None else speed_tolerance
+    hold_time = SETTLE_HOLD_TIME if hold_time is None else hold_time
+    timeout = ARRIVAL_TIMEOUT if timeout is None else timeout
+
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    deadline = start_time + timeout
+    settled_since = None
+    updates = hub.subscribe("position_velocity_ned")
+    try:
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                position_velocity = await next_update(updates, remaining)
+            except asyncio.TimeoutError:
+                break
+            except TelemetryStreamError as e:
+                print(f"-- Position telemetry lost: {e}")
+                break
+
+            position = position_velocity.position
+            velocity = position_velocity.velocity
+            speed = math.sqrt(velocity.north_m_s ** 2 + velocity.east_m_s ** 2 + velocity.down_m_s ** 2)
+            settled = speed <= speed_tolerance
+
+            if target is not None:
+                north, east, down = target
+                distance = math.sqrt((position.north_m - north) ** 2 + (position.east_m - east) ** 2 + (position.down_m - down) ** 2)
+                settled = settled and distance <= tolerance
+
+            now = loop.time()
+            if not settled:
+                settled_since = None
+            elif settled_since is None:
+                settled_since = now
+
+            if settled_since is not None and now - settled_since >= hold_time:
+                return now - start_time
+        return None
+    finally:
+        hub.unsubscribe("position_velocity_ned", updates)
+
+
+async def fly_to_ned(drone, hub, north, east, down, yaw):
     print(f"-- Flying to NED position: N{north}, E{east}, D{down}")
     await drone.offboard.set_position_ned(PositionNedYaw(north, east, down, yaw))
-    await asyncio.sleep(10)  # optional sleep
 
-# Drop the payload
-async def drop_payload(drone):
+    leg_time = await wait_for_settle(hub, target=(north, east, down))
+    if leg_time is None:
+        print(f"-- Did not reach N{north}, E{east}, D{down} within {ARRIVAL_TIMEOUT} seconds")
+        return False
+
+    print(f"-- Reached N{north}, E{east}, D{down} in {leg_time:.1f} seconds")
+    return True
+
+# Drop the payload (settled=True when the caller already knows the drone is holding still, e.g. after fly_to_ned)
+async def drop_payload(drone, hub, settled=False):
+    # Waits for the drone to stop moving so the drop lands where it should
+    if not settled:
+        settle_time = await wait_for_settle(hub)
+        if settle_time is None:
+            print(f"-- Drone did not settle within {ARRIVAL_TIMEOUT} seconds, skipping payload drop")
+            return False
+        print(f"-- Drone settled in {settle_time:.1f} seconds")
+
     print("-- Opening Actuator 1 to drop payload")
     await drone.action.actuator_control([0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
-    await asyncio.sleep(2)  # also optional
+    await asyncio.sleep(PAYLOAD_RELEASE_TIME)
 
     print("-- Closing Actuator 1")
     await drone.action.actuator_control([0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+    return True
 
 
-# Checks telemetry health (important for next function)
-async def check_telemetry(drone):
-    async for health in drone.telemetry.health():
-        if health.is_global_position_ok:
-            return True
+# Waits for the next health message (False if it isn't OK, doesn't come in time or the stream failed)
+async def next_health_ok(health_updates, timeout):
+    try:
+        health = await next_update(health_updates, timeout)
+    except (asyncio.TimeoutError, TelemetryStreamError):
         return False
+    return health.is_global_position_ok
+
+
+# Waits up to timeout seconds for telemetry to come back
+async def wait_for_telemetry(health_updates, timeout):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while (remaining := deadline - loop.time()) > 0:
+        if await next_health_ok(health_updates, min(remaining, HEALTH_TIMEOUT)):
+            return True
+    return False
+
 
 # This runs in an async function in the background
-async def background_telemetry_check(drone):
-    while True:  # Checks constantly
+async def background_telemetry_check(drone, hub):
+    health_updates = hub.subscribe("health")
+    try:
         print("-- Checking health of telemetry")
-        telemetry_ok = await check_telemetry(drone)
+        while True:  # Checks every health message
+            if await next_health_ok(health_updates, HEALTH_TIMEOUT):
+                continue
+
+            print(f"-- Telemetry lost! Waiting up to {TELEMETRY_LOST_WAIT} seconds.")  # First check
+            if await wait_for_telemetry(health_updates, TELEMETRY_LOST_WAIT):
+                print("-- Telemetry OK. Continuing background checks.")
+                continue
 
-        if not telemetry_ok: # First check, waits 30 seconds
-            print("-- Telemetry lost! Waiting for 30 seconds.")
-            await asyncio.sleep(30)
+            print("-- Telemetry still lost! Switching to RTL mode.")  # 2nd check
+            await drone.action.return_to_launch()
 
-            telemetry_ok = await check_telemetry(drone)
-            if not telemetry_ok: # 2nd check, waits 3 minutes
-                print("-- Telemetry still lost! Switching to RTL mode.")
-                await drone.action.return_to_launch()
+            print(f"-- Waiting up to {RTL_WAIT} seconds in RTL mode.")
+            if await wait_for_telemetry(health_updates, RTL_WAIT):
+                print("-- Telemetry OK. Continuing background checks.")
+                continue
 
-                print("-- Waiting for 3 minutes in RTL mode.")
-                await asyncio.sleep(180)
+            print("-- Telemetry still lost! Killing all motor operations.")  # 3rd check, kills motors
+            await drone.action.kill()
+            return
+    finally:
+        hub.unsubscribe("health", health_updates)
 
-                telemetry_ok = await check_telemetry(drone) 
-                if not telemetry_ok: # 3rd check, kills motors
-                    print("-- Telemetry still lost! Killing all motor operations.")
-                    await drone.action.kill()
-                    return  
+async def main(drone=None, log_directory="flight_logs"):
+    drone = await connect_drone(drone)
 
-        print("-- Telemetry OK. Continuing background checks.")
-        await asyncio.sleep(10) # checks every 10 seconds
+    # Every telemetry stream is opened once and shared
+    hub = TelemetryHub(drone)
+    hub.start()
 
-async def main():
-    drone = await connect_drone()
+    # Records telemetry for the whole flight
+    recorder = FlightRecorder(hub, directory=log_directory)
+    recorder.start()
 
     # Asynchronous checking
-    asyncio.create_task(background_telemetry_check(drone))
+    telemetry_check = asyncio.create_task(background_telemetry_check(drone, hub))
 
-    mission_complete = await monitor_mission(drone)
+    mission_complete = await monitor_mission(hub)
     if mission_complete:
 
         offboard_started = await switch_to_offboard(drone)
         if offboard_started:
 
-            await fly_to_ned(drone, north=20.0, east=10.0, down=-5.0, yaw=90.0)
+            reached = await fly_to_ned(drone, hub, north=20.0, east=10.0, down=-5.0, yaw=90.0)
 
 
-            await drop_payload(drone)
+            # Only drop the payload over the drop point (fly_to_ned already waited for the drone to settle there)
+            if reached:
+                await drop_payload(drone, hub, settled=True)
+            else:
+                print("-- Drop point not reached, skipping payload drop")
 
 
             print("-- Stopping offboard mode")
@@ -114,6 +326,14 @@ async def main():
             print("-- Landing")
             await drone.action.land()
 
+    telemetry_check.cancel()
+    await recorder.stop()
+    await hub.stop()
+
+    overhead = recorder.overhead()
+    print(f"-- Recorded {overhead['samples']} telemetry samples "
+          f"({overhead['us_per_sample']:.1f} us each, {100 * overhead['loop_fraction']:.2f}% of the event loop)")
+
     print("Mission, offboard operation, and payload drop completed. Stopping script.")
 
 
@@ -0,0 +1,232 @@
+import asyncio
+import math
+from collections import namedtuple
+
+
+# Telemetry values with the same field names as MAVSDK's
+ConnectionState = namedtuple("ConnectionState", "uuid is_connected")
+MissionProgress = namedtuple("MissionProgress", "current total")
+Health = namedtuple("Health", "is_gyrometer_calibration_ok is_accelerometer_calibration_ok is_magnetometer_calibration_ok "
+                              "is_local_position_ok is_global_position_ok is_home_position_ok is_armable")
+Position = namedtuple("Position", "latitude_deg longitude_deg absolute_altitude_m relative_altitude_m")
+EulerAngle = namedtuple("EulerAngle", "roll_deg pitch_deg yaw_deg timestamp_us")
+PositionNed = namedtuple("PositionNed", "north_m east_m down_m")
+VelocityNed = namedtuple("VelocityNed", "north_m_s east_m_s down_m_s")
+PositionVelocityNed = namedtuple("PositionVelocityNed", "position velocity")
+Battery = namedtuple("Battery", "id voltage_v remaining_percent")
+
+
+# Raised like MAVSDK's OffboardError when offboard can't start
+class SimOffboardError(Exception):
+    pass
+
+
+# Lightweight stand-in for mavsdk.System (connection, mission progress, telemetry, offboard, actions)
+# Times are in simulated seconds; time_scale > 1 runs the simulation faster than real time
+class SimulatedDrone:
+    def __init__(self, time_scale=1.0, mission_items=5, mission_item_time=2.0, max_speed=5.0,
+                 command_latency=0.01, connect_delay=0.5, home=(38.3150, -76.5500, 10.0)):
+        self.time_scale = time_scale
+        self.mission_items = mission_items
+        self.mission_item_time = mission_item_time
+        self.max_speed = max_speed
+        self.command_latency = command_latency
+        self.connect_delay = connect_delay
+        self.home = home
+
+        # Vehicle state (NED meters from home)
+        self.position = [0.0, 0.0, -5.0]
+        self.velocity = [0.0, 0.0, 0.0]
+        self.yaw = 0.0
+        self.target = None
+        self.setpoint = None
+        self.mode = "mission"
+        self.armed = True
+        self.actuators = [0.0] * 8
+
+        self.command_log = []  # (sim time, command name)
+        self.faults = []  # (start, end, mode) telemetry loss windows
+        self._start_time = None
+        self._state_time = 0.0
+
+        self.core = _Core(self)
+        self.mission = _Mission(self)
+        self.telemetry = _Telemetry(self)
+        self.offboard = _Offboard(self)
+        self.action = _Action(self)
+
+    async def connect(self, system_address=None):
+        self._start_time = asyncio.get_running_loop().time()
+
+    # Simulated seconds since connect
+    def sim_time(self):
+        if self._start_time is None:
+            return 0.0
+        return (asyncio.get_running_loop().time() - self._start_time) * self.time_scale
+
+    async def sleep(self, sim_seconds):
+        await asyncio.sleep(sim_seconds / self.time_scale)
+
+    # Makes telemetry go quiet ("silent") or report a bad position ("unhealthy") from start for duration sim seconds
+    def inject_telemetry_loss(self, start, duration=math.inf, mode="silent"):
+        self.faults.append((start, start + duration, mode))
+
+    def _fault_mode(self):
+        now = self.sim_time()
+        for start, end, mode in self.faults:
+            if start <= now < end:
+                return mode
+        return None
+
+    # Moves the vehicle towards its target up to now (fixed physics steps, only when something looks at the state)
+    def _advance(self):
+        now = self.sim_time()
+        dt = 0.02
+        while self._state_time + dt <= now:
+            self._state_time += dt
+            if not self.armed or self.target is None:
+                self.velocity = [0.0, 0.0, 0.0]
+                continue
+
+            error = [t - p for t, p in zip(self.target, self.position)]
+            distance = math.sqrt(sum(e * e for e in error))
+            # Slows down close to the target (1 m/s per meter), capped at max_speed
+            speed = min(self.max_speed, distance)
+            self.velocity = [e / distance * speed if distance > 1e-9 else 0.0 for e in error]
+            self.position = [p + v * dt for p, v in zip(self.position, self.velocity)]
+
+    async def _command(self, name):
+        await self.sleep(self.command_latency)
+        self.command_log.append((self.sim_time(), name))
+        self._advance()
+
+    # Yields make_value() at rate_hz (sim time) while telemetry is up
+    async def _stream(self, rate_hz, make_value, health_stream=False):
+        while True:
+            await self.sleep(1.0 / rate_hz)
+            fault = self._fault_mode()
+            if fault == "silent" or (fault == "unhealthy" and not health_stream):
+                continue
+            self._advance()
+            yield make_value()
+
+
+class _Core:
+    def __init__(self, drone):
+        self.drone = drone
+
+    async def connection_state(self):
+        yield ConnectionState(1, False)
+        await self.drone.sleep(self.drone.connect_delay)
+        while True:
+            yield ConnectionState(1, True)
+            await self.drone.sleep(1.0)
+
+
+class _Mission:
+    def __init__(self, drone):
+        self.drone = drone
+
+    def _progress(self):
+        drone = self.drone
+        return MissionProgress(min(int(drone.sim_time() / drone.mission_item_time), drone.mission_items), drone.mission_items)
+
+    def mission_progress(self):
+        return self.drone._stream(1.0, self._progress)
+
+
+class _Telemetry:
+    def __init__(self, drone):
+        self.drone = drone
+
+    def _health(self):
+        ok = self.drone._fault_mode() is None
+        return Health(True, True, True, ok, ok, True, self.drone.armed)
+
+    def _position(self):
+        lat, lon, alt = self.drone.home
+        north, east, down = self.drone.position
+        return Position(lat + north / 111320.0, lon + east / (111320.0 * math.cos(math.radians(lat))), alt - down, -down)
+
+    def _attitude(self):
+        return EulerAngle(0.0, 0.0, self.drone.yaw, int(self.drone.sim_time() * 1e6))
+
+    def _velocity(self):
+        return VelocityNed(*self.drone.velocity)
+
+    def _position_velocity(self):
+        return PositionVelocityNed(PositionNed(*self.drone.position), VelocityNed(*self.drone.velocity))
+
+    def _battery(self):
+        remaining = max(0.0, 1.0 - self.drone.sim_time() / 1800.0)  # 30 minute battery
+        return Battery(0, 14.0 + 2.8 * remaining, remaining)
+
+    def health(self):
+        return self.drone._stream(1.0, self._health, health_stream=True)
+
+    def position(self):
+        return self.drone._stream(10.0, self._position)
+
+    def attitude_euler(self):
+        return self.drone._stream(50.0, self._attitude)
+
+    def velocity_ned(self):
+        return self.drone._stream(10.0, self._velocity)
+
+    def position_velocity_ned(self):
+        return self.drone._stream(10.0, self._position_velocity)
+
+    def battery(self):
+        return self.drone._stream(1.0, self._battery)
+
+
+class _Offboard:
+    def __init__(self, drone):
+        self.drone = drone
+
+    async def set_position_ned(self, position_ned_yaw):
+        await self.drone._command("set_position_ned")
+        self.drone.setpoint = (position_ned_yaw.north_m, position_ned_yaw.east_m, position_ned_yaw.down_m)
+        self.drone.yaw = position_ned_yaw.yaw_deg
+        if self.drone.mode == "offboard":
+            self.drone.target = self.drone.setpoint
+
+    async def start(self):
+        await self.drone._command("offboard_start")
+        if self.drone.setpoint is None:
+            raise SimOffboardError("No setpoint set")
+        self.drone.mode = "offboard"
+        self.drone.target = self.drone.setpoint
+
+    async def stop(self):
+        await self.drone._command("offboard_stop")
+        self.drone.mode = "hold"
+        self.drone.target = tuple(self.drone.position)
+
+
+class _Action:
+    def __init__(self, drone):
+        self.drone = drone
+
+    async def actuator_control(self, controls):
+        await self.drone._command("actuator_control")
+        self.drone.actuators = list(controls)
+
+    async def return_to_launch(self):
+        await self.drone._command("return_to_launch")
+        self.drone.mode = "rtl"
+        self.drone.target = (0.0, 0.0, self.drone.position[2])
+
+    async def land(self):
+        await self.drone._command("land")
+        self.drone.mode = "land"
+        self.drone.target = (self.drone.position[0], self.drone.position[1], 0.0)
+
+    async def disarm(self):
+        await self.drone._command("disarm")
+        self.drone.armed = False
+
+    async def kill(self):
+        await self.drone._command("kill")
+        self.drone.armed = False
+        self.drone.mode = "killed"